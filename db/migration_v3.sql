@@ -0,0 +1,163 @@
+-- Migration script to add incremental drift statistics, baseline snapshots, Page-Hinkley state
+-- and drift query indexes to existing databases
+-- Run this after migration_v2.sql, with psql outside a transaction block; the CONCURRENTLY
+-- index build cannot run inside one, so the drift_stats steps open their own below
+
+-- Optional: server-side embedding averages in the drift service (requires pgvector >= 0.7);
+-- created only where installed, otherwise the service falls back to averaging fetched embeddings
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'vector') THEN
+        CREATE EXTENSION IF NOT EXISTS vector;
+    END IF;
+END
+$$;
+
+-- Compact range index for drift window scans; rows arrive in created_at order
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_inference_logs_created_at_brin
+ON inference_logs USING BRIN (created_at);
+
+-- Statistics table, seed and trigger in one transaction: SHARE mode holds off drift_runs
+-- inserts until the trigger exists, so no stable run is missed or counted twice
+BEGIN;
+
+-- Running statistics of stable drift runs (Welford's online algorithm)
+CREATE TABLE IF NOT EXISTS drift_stats (
+    model_id INTEGER REFERENCES models(id),
+    metric_name VARCHAR(50) NOT NULL,
+    n BIGINT NOT NULL,
+    mean FLOAT NOT NULL,
+    m2 FLOAT NOT NULL,
+    updated_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (model_id, metric_name)
+);
+
+CREATE OR REPLACE FUNCTION update_drift_stat(p_model_id INTEGER, p_metric_name VARCHAR, x FLOAT) RETURNS VOID AS $$
+BEGIN
+    IF x IS NULL THEN
+        RETURN;
+    END IF;
+    -- SET expressions all see the pre-update row, so mean_new is spelled out for m2
+    INSERT INTO drift_stats (model_id, metric_name, n, mean, m2)
+    VALUES (p_model_id, p_metric_name, 1, x, 0)
+    ON CONFLICT (model_id, metric_name) DO UPDATE SET
+        n = drift_stats.n + 1,
+        mean = drift_stats.mean + (x - drift_stats.mean) / (drift_stats.n + 1),
+        m2 = drift_stats.m2 + (x - drift_stats.mean)
+             * (x - (drift_stats.mean + (x - drift_stats.mean) / (drift_stats.n + 1))),
+        updated_at = NOW();
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION drift_runs_update_stats() RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.drift_detected = false THEN
+        PERFORM update_drift_stat(NEW.model_id, 'kl_divergence', NEW.kl_divergence);
+        PERFORM update_drift_stat(NEW.model_id, 'cosine_similarity', NEW.cosine_similarity);
+        PERFORM update_drift_stat(NEW.model_id, 'embedding_drift', NEW.embedding_drift);
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+LOCK TABLE drift_runs IN SHARE MODE;
+
+-- Seed statistics from existing stable drift runs
+INSERT INTO drift_stats (model_id, metric_name, n, mean, m2)
+SELECT r.model_id, m.metric_name, COUNT(m.x), AVG(m.x), COALESCE(VAR_POP(m.x) * COUNT(m.x), 0)
+FROM drift_runs r
+CROSS JOIN LATERAL (VALUES
+    ('kl_divergence', r.kl_divergence),
+    ('cosine_similarity', r.cosine_similarity),
+    ('embedding_drift', r.embedding_drift)
+) AS m(metric_name, x)
+WHERE r.drift_detected = false
+  AND m.x IS NOT NULL
+GROUP BY r.model_id, m.metric_name
+ON CONFLICT (model_id, metric_name) DO NOTHING;
+
+DROP TRIGGER IF EXISTS drift_runs_stats ON drift_runs;
+CREATE TRIGGER drift_runs_stats
+AFTER INSERT ON drift_runs
+FOR EACH ROW EXECUTE FUNCTION drift_runs_update_stats();
+
+COMMIT;
+
+-- Precomputed baseline summaries, refreshed by the drift service
+CREATE TABLE IF NOT EXISTS baseline_snapshots (
+    id SERIAL PRIMARY KEY,
+    model_id INTEGER REFERENCES models(id),
+    baseline_minutes INTEGER NOT NULL,
+    window_minutes INTEGER NOT NULL,
+    distribution DOUBLE PRECISION[] NOT NULL,
+    sample_count INTEGER NOT NULL,
+    embedding_direction DOUBLE PRECISION[],
+    embedding_count INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_baseline_snapshots_lookup
+ON baseline_snapshots(model_id, baseline_minutes, window_minutes, created_at DESC);
+
+-- Streaming Page-Hinkley test on confidences, one row per model
+CREATE TABLE IF NOT EXISTS ph_state (
+    model_id INTEGER PRIMARY KEY REFERENCES models(id),
+    n BIGINT NOT NULL DEFAULT 0,
+    mean FLOAT NOT NULL DEFAULT 0,
+    up_sum FLOAT NOT NULL DEFAULT 0,      -- Cumulative (x - mean - delta), tracks increases
+    up_min FLOAT NOT NULL DEFAULT 0,
+    down_sum FLOAT NOT NULL DEFAULT 0,    -- Cumulative (x - mean + delta), tracks decreases
+    down_max FLOAT NOT NULL DEFAULT 0,
+    delta FLOAT NOT NULL DEFAULT 0.05,    -- Tolerated change in mean confidence
+    threshold FLOAT NOT NULL DEFAULT 2.0, -- Lambda; higher = fewer false alarms
+    last_change_at TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE OR REPLACE FUNCTION inference_logs_update_ph() RETURNS TRIGGER AS $$
+DECLARE
+    s ph_state%ROWTYPE;
+    x FLOAT := COALESCE(NEW.confidence, 0.5);
+BEGIN
+    IF NEW.model_id IS NULL THEN
+        RETURN NEW;
+    END IF;
+    INSERT INTO ph_state (model_id) VALUES (NEW.model_id) ON CONFLICT (model_id) DO NOTHING;
+    SELECT * INTO s FROM ph_state WHERE model_id = NEW.model_id FOR UPDATE;
+
+    s.n := s.n + 1;
+    s.mean := s.mean + (x - s.mean) / s.n;
+    s.up_sum := s.up_sum + (x - s.mean - s.delta);
+    s.up_min := LEAST(s.up_min, s.up_sum);
+    s.down_sum := s.down_sum + (x - s.mean + s.delta);
+    s.down_max := GREATEST(s.down_max, s.down_sum);
+
+    -- On a change, record it and restart the test on the new regime
+    IF s.up_sum - s.up_min > s.threshold OR s.down_max - s.down_sum > s.threshold THEN
+        s.last_change_at := NEW.created_at;
+        s.n := 0;
+        s.mean := 0;
+        s.up_sum := 0;
+        s.up_min := 0;
+        s.down_sum := 0;
+        s.down_max := 0;
+    END IF;
+
+    UPDATE ph_state SET
+        n = s.n, mean = s.mean,
+        up_sum = s.up_sum, up_min = s.up_min,
+        down_sum = s.down_sum, down_max = s.down_max,
+        last_change_at = s.last_change_at,
+        updated_at = NOW()
+    WHERE model_id = NEW.model_id;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS inference_logs_ph ON inference_logs;
+CREATE TRIGGER inference_logs_ph
+AFTER INSERT ON inference_logs
+FOR EACH ROW EXECUTE FUNCTION inference_logs_update_ph();
+
+-- Display migration status
+SELECT 'Migration completed successfully' AS status;
@@ -0,0 +1,99 @@
+"""ADWIN adaptive windowing for change detection (Bifet & Gavalda, 2007)."""
+
+import math
+from collections import deque
+from typing import Deque, Iterator, List, Tuple
+
+
+class ADWIN:
+    """
+    Adaptive sliding window over a stream of values in [0, 1].
+
+    The window is kept as an exponential histogram: level i holds up to
+    max_buckets buckets, each summing 2**i consecutive values. Whenever the
+    window can be split into an older and a newer part whose means differ by
+    more than the Hoeffding bound, the oldest bucket is dropped, so the window
+    grows while the stream is stationary and shrinks after a change.
+    """
+
+    def __init__(self, delta: float = 0.002, max_buckets: int = 5, clock: int = 32,
+                 min_window_length: int = 5):
+        self.delta = delta
+        self.max_buckets = max_buckets
+        self.clock = clock  # Test for a cut every `clock` updates
+        self.min_window_length = min_window_length
+        self.width = 0
+        self.total = 0.0
+        self._levels: List[Deque[float]] = []  # Bucket sums per level, newest first
+        self._pending = 0
+        self._detected = False
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.width if self.width else 0.0
+
+    def update(self, value: float):
+        """Add a value to the window, testing for a change every `clock` updates."""
+        self._insert(value)
+        self._pending += 1
+        if self._pending >= self.clock:
+            self._check()
+
+    def detected_change(self) -> bool:
+        """Run any pending cut test and report whether a change was ever detected."""
+        if self._pending:
+            self._check()
+        return self._detected
+
+    def _insert(self, value: float):
+        if not self._levels:
+            self._levels.append(deque())
+        self._levels[0].appendleft(value)
+        self.width += 1
+        self.total += value
+
+        # Merge the two oldest buckets of an overflowing level into the next level
+        i = 0
+        while len(self._levels[i]) > self.max_buckets:
+            merged = self._levels[i].pop() + self._levels[i].pop()
+            if i + 1 == len(self._levels):
+                self._levels.append(deque())
+            self._levels[i + 1].appendleft(merged)
+            i += 1
+
+    def _buckets_oldest_first(self) -> Iterator[Tuple[int, float]]:
+        for i in range(len(self._levels) - 1, -1, -1):
+            for bucket_sum in reversed(self._levels[i]):
+                yield 2 ** i, bucket_sum
+
+    def _check(self):
+        self._pending = 0
+        reduced = True
+        while reduced and self.width > 2 * self.min_window_length:
+            reduced = False
+            n0, sum0 = 0, 0.0
+            n1, sum1 = self.width, self.total
+            for size, bucket_sum in self._buckets_oldest_first():
+                n0 += size
+                sum0 += bucket_sum
+                n1 -= size
+                sum1 -= bucket_sum
+                if n1 < self.min_window_length:
+                    break
+                if n0 >= self.min_window_length and self._is_cut(n0, sum0, n1, sum1):
+                    self._drop_oldest()
+                    reduced = self._detected = True
+                    break
+
+    def _is_cut(self, n0: int, sum0: float, n1: int, sum1: float) -> bool:
+        # Hoeffding bound with harmonic mean m and delta' = delta / |W|
+        m = 1.0 / (1.0 / n0 + 1.0 / n1)
+        epsilon = math.sqrt(math.log(4.0 * self.width / self.delta) / (2.0 * m))
+        return abs(sum0 / n0 - sum1 / n1) > epsilon
+
+    def _drop_oldest(self):
+        i = len(self._levels) - 1
+        self.width -= 2 ** i
+        self.total -= self._levels[i].pop()
+        while self._levels and not self._levels[-1]:
+            self._levels.pop()
@@ -1,45 +1,81 @@
 """Drift computation service for ML model monitoring."""
 
+import asyncio
+import io
+import logging
 import os
+import threading
+import time
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
-from typing import List, Optional, Tuple
+from functools import lru_cache
+from typing import Dict, List, Literal, NamedTuple, Optional, Tuple
 
 import numpy as np
-from scipy.stats import entropy
-from scipy.spatial.distance import cosine
-from fastapi import FastAPI, HTTPException
+from fastapi import BackgroundTasks, FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
-import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extensions import connection as BaseConnection, cursor as TupleCursor, new_type, register_type
+from psycopg2.extras import RealDictCursor, execute_values
+from psycopg2.pool import ThreadedConnectionPool
 
+from adwin import ADWIN
 
-app = FastAPI(title="Drift Service")
+
+app = FastAPI(title="Drift Service", default_response_class=ORJSONResponse)
+logger = logging.getLogger("drift-service")
 
 DATABASE_URL = os.environ.get("DATABASE_URL")
 
+# Connection pool sizing. DB_POOL_MIN_CONNECTIONS are opened up front; every connection
+# opened later stays idle in the pool for reuse (see DriftConnectionPool)
+DB_POOL_MIN_CONNECTIONS = 2
+DB_CONNECTIONS_PER_REQUEST = 5  # Held at once by a histogram request on a baseline miss
+DB_CONCURRENT_REQUESTS = 8  # Requests served without waiting for a connection
+DB_BACKGROUND_CONNECTIONS = 2  # Background baseline refresh
+DB_POOL_MAX_CONNECTIONS = DB_CONNECTIONS_PER_REQUEST * DB_CONCURRENT_REQUESTS + DB_BACKGROUND_CONNECTIONS
+
 # Base thresholds (will be adapted)
 BASE_KL_THRESHOLD = 0.1
 BASE_COSINE_THRESHOLD = 0.9
 BASE_EMBEDDING_THRESHOLD = 0.15
 MIN_SAMPLES = 5
 HISTOGRAM_BINS = 10
+HISTOGRAM_EDGES = np.linspace(0, 1, HISTOGRAM_BINS + 1)  # The bin edges np.histogram uses on [0, 1]
 
 # Adaptive threshold parameters
-ADAPTIVE_WINDOW_SIZE = 100  # Use last N drift runs to adapt
 ADAPTIVE_STD_MULTIPLIER = 2.0  # Threshold = mean + (std * multiplier)
 MIN_ADAPTIVE_SAMPLES = 10  # Minimum runs before adapting
 
+# Baseline cache parameters
+BASELINE_CACHE_BUCKET_SECONDS = 60  # Cached baselines are reused within this interval
+BASELINE_CACHE_SIZE = 256
+
+# Baseline snapshot parameters
+BASELINE_REFRESH_SECONDS = 300  # Background refresh interval for baseline_snapshots
+BASELINE_SNAPSHOT_MAX_AGE_SECONDS = 2 * BASELINE_REFRESH_SECONDS  # Older snapshots are recomputed
+BASELINE_SNAPSHOT_RETENTION_MINUTES = 1440
+
+# Default drift windows
+DEFAULT_WINDOW_MINUTES = 60
+DEFAULT_BASELINE_MINUTES = 1440
+
+# ADWIN detector parameters
+ADWIN_DELTA = 0.002  # Confidence of the Hoeffding cut test; lower = fewer false alarms
+
 
 class DriftRequest(BaseModel):
     model_id: int = 1
-    window_minutes: int = 60
-    baseline_minutes: int = 1440
+    window_minutes: int = DEFAULT_WINDOW_MINUTES
+    baseline_minutes: int = DEFAULT_BASELINE_MINUTES
+    detector: Literal["histogram", "adwin", "page_hinkley"] = "histogram"
 
 
 class DriftResponse(BaseModel):
-    kl_divergence: float
-    cosine_similarity: float
+    kl_divergence: Optional[float]
+    cosine_similarity: Optional[float]
     embedding_drift: Optional[float]
     drift_detected: bool
     window_start: datetime
@@ -49,141 +85,633 @@ class DriftResponse(BaseModel):
     thresholds: dict
 
 
-@contextmanager
-def get_db():
-    """Database connection context manager."""
-    conn = psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
-    try:
-        cursor = conn.cursor()
-        yield cursor, conn
-        conn.commit()
-    finally:
-        conn.close()
+class DriftConnection(BaseConnection):
+    """Connection that remembers which statements it has prepared server-side."""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+
+def drift_response(**fields) -> ORJSONResponse:
+    """
+    Serialize DriftResponse fields with orjson directly. Returning a Response skips
+    FastAPI's response_model validation; DriftResponse still documents the schema.
+    """
+    return ORJSONResponse(fields)
 
 
-def to_distribution(values: np.ndarray) -> np.ndarray:
-    """Convert values to normalized probability distribution."""
-    if len(values) == 0:
+class DriftConnectionPool(ThreadedConnectionPool):
+    """
+    Pool that keeps every returned connection open, up to maxconn, for reuse.
+    psycopg2 keeps only minconn idle connections and closes the rest, so concurrent
+    fetches would reconnect, and re-PREPARE, on most checkouts.
+    """
+    
+    def __init__(self, minconn, maxconn, *args, **kwargs):
+        super().__init__(minconn, maxconn, *args, **kwargs)
+        # After the initial connections, minconn only caps idle connections in _putconn
+        self.minconn = self.maxconn
+
+
+_pool: Optional[DriftConnectionPool] = None
+_pool_lock = threading.Lock()
+# ThreadedConnectionPool raises PoolError when exhausted; callers wait here instead
+_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX_CONNECTIONS)
+
+
+def get_pool() -> DriftConnectionPool:
+    """Return the shared connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = DriftConnectionPool(
+                    DB_POOL_MIN_CONNECTIONS,
+                    DB_POOL_MAX_CONNECTIONS,
+                    dsn=DATABASE_URL,
+                    connection_factory=DriftConnection,
+                    cursor_factory=RealDictCursor,
+                )
+    return _pool
+
+
+@contextmanager
+def get_db():
+    """
+    Database connection context manager backed by the connection pool.
+    Blocks until a pooled connection is free rather than failing.
+    """
+    pool = get_pool()
+    with _pool_slots:
+        conn = pool.getconn()
+        try:
+            cursor = conn.cursor()
+            yield cursor, conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            pool.putconn(conn)
+
+
+def tuple_cursor(conn):
+    """Open a plain tuple cursor for hot-path fetches, avoiding a dict per row."""
+    return conn.cursor(cursor_factory=TupleCursor)
+
+
+def run_with_connection(fn, *args, tuple_rows: bool = True):
+    """Check out a pooled connection and call fn(cursor, *args) inside its transaction."""
+    with get_db() as (cursor, conn):
+        return fn(tuple_cursor(conn) if tuple_rows else cursor, *args)
+
+
+def execute_prepared(cursor, name: str, sql: str, params: tuple):
+    """Execute sql as a named prepared statement, preparing it once per pooled connection."""
+    conn = cursor.connection
+    if name not in conn.prepared:
+        cursor.execute(f"PREPARE {name} AS {sql}")
+        conn.prepared.add(name)
+    cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+
+
+def histogram_counts(values: np.ndarray) -> np.ndarray:
+    """Bin raw confidence values into HISTOGRAM_BINS counts on [0, 1], like np.histogram."""
+    in_range = values[(values >= 0) & (values <= 1)]
+    # Uniform bins need no edge search; 1.0 falls into the last bin
+    bins = np.minimum((in_range * HISTOGRAM_BINS).astype(np.intp), HISTOGRAM_BINS - 1)
+    # Scaling rounds values next to an edge (0.3 * 10 > 3) into the wrong bin;
+    # correct against HISTOGRAM_EDGES the way np.histogram does
+    bins[in_range < HISTOGRAM_EDGES[bins]] -= 1
+    bins[(in_range >= HISTOGRAM_EDGES[bins + 1]) & (bins < HISTOGRAM_BINS - 1)] += 1
+    return np.bincount(bins, minlength=HISTOGRAM_BINS).astype(np.float64)
+
+
+def to_distribution(counts: np.ndarray) -> np.ndarray:
+    """Convert pre-binned histogram counts to normalized probability distribution."""
+    total = counts.sum()
+    if total == 0:
         return np.ones(HISTOGRAM_BINS) / HISTOGRAM_BINS
     
-    hist, _ = np.histogram(values, bins=HISTOGRAM_BINS, range=(0, 1), density=True)
+    # Density scaling, matching np.histogram(..., density=True) on [0, 1]
+    hist = counts * HISTOGRAM_BINS / total
     hist = hist + 1e-10
     return hist / hist.sum()
 
 
 def kl_divergence(p: np.ndarray, q: np.ndarray) -> float:
-    """Compute KL divergence D(P||Q)."""
-    return float(entropy(p, q))
+    """Compute KL divergence D(P||Q) for normalized, smoothed distributions."""
+    return float(np.sum(p * np.log(p / q)))
 
 
 def cosine_similarity(p: np.ndarray, q: np.ndarray) -> float:
     """Compute cosine similarity between distributions."""
-    return float(1 - cosine(p, q))
+    return float(p @ q / np.sqrt((p @ p) * (q @ q)))
+
 
+def mean_direction(embeddings: np.ndarray) -> np.ndarray:
+    """Compute the unit-length mean of L2-normalized embeddings."""
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    mean = (embeddings / norms).mean(axis=0)
+    mean_norm = np.linalg.norm(mean)
+    return mean / mean_norm if mean_norm > 0 else mean
 
-def embedding_distance(embeddings_baseline: List[np.ndarray], embeddings_recent: List[np.ndarray]) -> float:
-    """Compute mean cosine distance between embedding sets."""
-    if not embeddings_baseline or not embeddings_recent:
-        return 0.0
+
+def embedding_distance(direction_baseline: np.ndarray, direction_recent: np.ndarray) -> float:
+    """Compute cosine distance between the mean directions of two embedding sets."""
+    return float(1 - direction_baseline @ direction_recent)
+
+
+def fetch_confidence_histogram(cursor, model_id: int, start_interval: int, end_interval: int = 0
+                               ) -> Tuple[np.ndarray, int]:
+    """
+    Fetch binned confidence counts within a time window.
+    Binning happens in Postgres so only HISTOGRAM_BINS counts are transferred.
+    Buckets are bounded by HISTOGRAM_EDGES, matching np.histogram and histogram_counts.
+    Expects a tuple cursor (see tuple_cursor).
+    Returns: (hist, sample_count)
+    """
+    execute_prepared(cursor, "drift_histogram", """
+        SELECT CASE WHEN conf = 1 THEN $1 ELSE width_bucket(conf, $5::float8[]) END AS bucket,
+               COUNT(*) AS n
+        FROM (
+            SELECT COALESCE(confidence, 0.5) AS conf
+            FROM inference_logs 
+            WHERE model_id = $2 
+              AND created_at > date_trunc('minute', NOW()) - make_interval(mins => $3)
+              AND created_at <= date_trunc('minute', NOW()) - make_interval(mins => $4)
+        ) windowed
+        GROUP BY bucket
+    """, (HISTOGRAM_BINS, model_id, start_interval, end_interval, HISTOGRAM_EDGES.tolist()))
     
-    # Compute mean embedding for each set
-    mean_baseline = np.mean(embeddings_baseline, axis=0)
-    mean_recent = np.mean(embeddings_recent, axis=0)
+    hist = np.zeros(HISTOGRAM_BINS)
+    sample_count = 0
+    for bucket, n in cursor:
+        sample_count += n
+        # Buckets 0 and HISTOGRAM_BINS + 1 hold out-of-range values, which
+        # count as samples but fall outside the histogram
+        if 1 <= bucket <= HISTOGRAM_BINS:
+            hist[bucket - 1] += n
     
-    # Return cosine distance (1 - cosine similarity)
-    return float(cosine(mean_baseline, mean_recent))
+    return hist, sample_count
 
 
-def fetch_confidence_values(cursor, model_id: int, start_interval: int, end_interval: int = 0):
-    """Fetch confidence values within a time window."""
-    cursor.execute("""
-        SELECT confidence FROM inference_logs 
+PGCOPY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+COPY_FLOAT8_ROW = np.dtype([("fields", ">i2"), ("length", ">i4"), ("value", ">f8")])
+COPY_TRAILER = b"\xff\xff"  # Field count -1
+
+
+def parse_copy_float8(data) -> np.ndarray:
+    """
+    Decode the output of a single float8 column COPY ... (FORMAT BINARY).
+    Each tuple is a field count, a field length and a big-endian double.
+    Accepts any bytes-like object; raises ValueError on anything else.
+    """
+    if bytes(data[:len(PGCOPY_SIGNATURE)]) != PGCOPY_SIGNATURE:
+        raise ValueError("Not a binary COPY stream")
+    extension_length = int.from_bytes(data[15:19], "big")
+    offset = 19 + extension_length
+    body_length = len(data) - offset - 2  # 2-byte trailer
+    if body_length < 0 or body_length % COPY_FLOAT8_ROW.itemsize or bytes(data[-2:]) != COPY_TRAILER:
+        raise ValueError("Truncated binary COPY stream")
+    
+    rows = np.frombuffer(data, dtype=COPY_FLOAT8_ROW, count=body_length // COPY_FLOAT8_ROW.itemsize,
+                         offset=offset)
+    if not ((rows["fields"] == 1).all() and (rows["length"] == 8).all()):
+        raise ValueError("Expected one non-null float8 column per row")
+    return rows["value"].astype(np.float64)
+
+
+def fetch_confidence_series(cursor, model_id: int, start_interval: int, end_interval: int = 0
+                            ) -> np.ndarray:
+    """
+    Fetch confidence values within a time window, oldest first.
+    Streams the rows with COPY BINARY instead of building one Python tuple per row.
+    """
+    query = cursor.mogrify("""
+        SELECT COALESCE(confidence, 0.5)::float8 FROM inference_logs 
         WHERE model_id = %s 
-          AND created_at > NOW() - INTERVAL '%s minutes'
-          AND created_at <= NOW() - INTERVAL '%s minutes'
-    """, (model_id, start_interval, end_interval))
+          AND created_at > date_trunc('minute', NOW()) - make_interval(mins => %s)
+          AND created_at <= date_trunc('minute', NOW()) - make_interval(mins => %s)
+        ORDER BY created_at, id
+    """, (model_id, start_interval, end_interval)).decode()
     
-    return np.array([
-        row['confidence'] if row['confidence'] is not None else 0.5 
-        for row in cursor.fetchall()
-    ])
+    buffer = io.BytesIO()
+    cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT BINARY)", buffer)
+    return parse_copy_float8(buffer.getbuffer())
 
 
-def fetch_embeddings(cursor, model_id: int, start_interval: int, end_interval: int = 0) -> List[np.ndarray]:
-    """Fetch embeddings within a time window."""
-    cursor.execute("""
+FLOAT8_ARRAY_OID = 1022
+
+
+def _cast_embedding(value: Optional[str], cursor) -> Optional[np.ndarray]:
+    """Parse a Postgres float8[] literal such as '{0.1,0.2}' straight into a float32 array."""
+    if value is None:
+        return None
+    return np.fromstring(value[1:-1], dtype=np.float32, sep=',')
+
+
+EMBEDDING_ARRAY = new_type((FLOAT8_ARRAY_OID,), "EMBEDDING_ARRAY", _cast_embedding)
+
+
+def fetch_embeddings(cursor, model_id: int, start_interval: int, end_interval: int = 0) -> np.ndarray:
+    """
+    Fetch embeddings within a time window into an (N, D) float32 array.
+    Expects a tuple cursor (see tuple_cursor); float8[] values on it are decoded
+    directly to ndarrays instead of lists of Python floats.
+    """
+    register_type(EMBEDDING_ARRAY, cursor)
+    execute_prepared(cursor, "drift_embeddings", """
         SELECT embedding FROM inference_logs 
-        WHERE model_id = %s 
+        WHERE model_id = $1 
           AND embedding IS NOT NULL
-          AND created_at > NOW() - INTERVAL '%s minutes'
-          AND created_at <= NOW() - INTERVAL '%s minutes'
+          AND cardinality(embedding) > 0
+          AND created_at > date_trunc('minute', NOW()) - make_interval(mins => $2)
+          AND created_at <= date_trunc('minute', NOW()) - make_interval(mins => $3)
     """, (model_id, start_interval, end_interval))
     
-    embeddings = []
-    for row in cursor.fetchall():
-        if row['embedding']:
-            embeddings.append(np.array(row['embedding']))
+    first = cursor.fetchone()
+    if first is None:
+        return np.empty((0, 0), dtype=np.float32)
+    
+    embeddings = np.empty((cursor.rowcount, len(first[0])), dtype=np.float32)
+    embeddings[0] = first[0]
+    for i, (embedding,) in enumerate(cursor, start=1):
+        embeddings[i] = embedding
     return embeddings
 
 
-def compute_adaptive_thresholds(cursor, model_id: int) -> Tuple[float, float, float]:
+_pgvector_available: Optional[bool] = None
+
+
+def has_pgvector(cursor) -> bool:
+    """Check once per process whether pgvector >= 0.7 (avg and l2_normalize) is installed."""
+    global _pgvector_available
+    if _pgvector_available is None:
+        cursor.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+        row = cursor.fetchone()
+        version = tuple(int(part) for part in row[0].split('.')[:2]) if row else ()
+        _pgvector_available = version >= (0, 7)
+    return _pgvector_available
+
+
+def fetch_embedding_mean(cursor, model_id: int, start_interval: int, end_interval: int = 0
+                         ) -> Tuple[Optional[np.ndarray], int]:
     """
-    Compute adaptive thresholds based on historical drift metrics.
-    Returns: (kl_threshold, cosine_threshold, embedding_threshold)
+    Average the L2-normalized embeddings of a time window inside Postgres with pgvector,
+    so a single D-dimensional vector is transferred instead of N embeddings.
+    Expects a tuple cursor (see tuple_cursor).
+    Returns: (mean of normalized embeddings or None, embedding_count)
+    """
+    execute_prepared(cursor, "drift_embedding_mean", """
+        SELECT avg(l2_normalize(embedding::vector))::real[], COUNT(*)
+        FROM inference_logs 
+        WHERE model_id = $1 
+          AND embedding IS NOT NULL
+          AND cardinality(embedding) > 0
+          AND created_at > date_trunc('minute', NOW()) - make_interval(mins => $2)
+          AND created_at <= date_trunc('minute', NOW()) - make_interval(mins => $3)
+    """, (model_id, start_interval, end_interval))
+    
+    mean, count = cursor.fetchone()
+    return (np.array(mean, dtype=np.float32) if mean is not None else None), count
+
+
+def fetch_embedding_direction(cursor, model_id: int, start_interval: int, end_interval: int = 0
+                              ) -> Tuple[Optional[np.ndarray], int]:
+    """
+    Compute the mean embedding direction of a time window, server-side when pgvector
+    is installed and from the fetched embeddings otherwise.
+    Expects a tuple cursor (see tuple_cursor).
+    Returns: (direction or None if no embeddings, embedding_count)
+    """
+    if has_pgvector(cursor):
+        mean, count = fetch_embedding_mean(cursor, model_id, start_interval, end_interval)
+        if mean is None:
+            return None, count
+        mean_norm = np.linalg.norm(mean)
+        return (mean / mean_norm if mean_norm > 0 else mean), count
+    
+    embeddings = fetch_embeddings(cursor, model_id, start_interval, end_interval)
+    if not len(embeddings):
+        return None, 0
+    return mean_direction(embeddings), len(embeddings)
+
+
+class Baseline(NamedTuple):
+    distribution: np.ndarray
+    sample_count: int
+    embedding_direction: Optional[np.ndarray]
+    embedding_count: int
+
+
+# Runs the confidence half of a baseline summary alongside the embedding half
+_baseline_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="baseline")
+
+
+def compute_baseline(model_id: int, baseline_minutes: int, window_minutes: int) -> Baseline:
+    """
+    Summarize the baseline window from inference_logs. The confidence histogram and
+    the embedding direction, which dominates on large windows, are computed
+    concurrently on separate pooled connections.
+    """
+    hist_future = _baseline_executor.submit(
+        run_with_connection, fetch_confidence_histogram, model_id, baseline_minutes, window_minutes)
+    direction, embedding_count = run_with_connection(
+        fetch_embedding_direction, model_id, baseline_minutes, window_minutes)
+    hist, sample_count = hist_future.result()
+    return Baseline(to_distribution(hist), sample_count, direction, embedding_count)
+
+
+def fetch_baseline_snapshot(cursor, model_id: int, baseline_minutes: int, window_minutes: int
+                            ) -> Optional[Baseline]:
+    """
+    Fetch the latest baseline snapshot younger than BASELINE_SNAPSHOT_MAX_AGE_SECONDS.
+    Expects a tuple cursor (see tuple_cursor).
     """
     cursor.execute("""
-        SELECT kl_divergence, cosine_similarity, embedding_drift 
-        FROM drift_runs 
+        SELECT distribution, sample_count, embedding_direction, embedding_count
+        FROM baseline_snapshots 
         WHERE model_id = %s 
-          AND drift_detected = false
+          AND baseline_minutes = %s 
+          AND window_minutes = %s
+          AND created_at > NOW() - make_interval(secs => %s)
         ORDER BY created_at DESC 
-        LIMIT %s
-    """, (model_id, ADAPTIVE_WINDOW_SIZE))
+        LIMIT 1
+    """, (model_id, baseline_minutes, window_minutes, BASELINE_SNAPSHOT_MAX_AGE_SECONDS))
     
-    rows = cursor.fetchall()
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    distribution, sample_count, direction, embedding_count = row
+    return Baseline(
+        np.array(distribution),
+        sample_count,
+        np.array(direction, dtype=np.float32) if direction is not None else None,
+        embedding_count,
+    )
+
+
+def store_baseline_snapshot(cursor, model_id: int, baseline_minutes: int, window_minutes: int,
+                            baseline: Baseline) -> bool:
+    """
+    Persist a baseline summary so other requests and replicas can reuse it.
+    Unknown models are skipped rather than violating the models foreign key.
+    Returns: whether a snapshot was stored
+    """
+    direction = baseline.embedding_direction
+    cursor.execute("""
+        INSERT INTO baseline_snapshots 
+        (model_id, baseline_minutes, window_minutes, distribution, sample_count, 
+         embedding_direction, embedding_count)
+        SELECT %s, %s, %s, %s::float8[], %s, %s::float8[], %s
+        WHERE EXISTS (SELECT 1 FROM models WHERE id = %s)
+    """, (model_id, baseline_minutes, window_minutes, baseline.distribution.tolist(),
+          baseline.sample_count, direction.tolist() if direction is not None else None,
+          baseline.embedding_count, model_id))
+    return cursor.rowcount == 1
+
+
+def refresh_baseline(model_id: int, baseline_minutes: int, window_minutes: int) -> Baseline:
+    """Recompute a baseline summary and persist it as a snapshot when the model exists."""
+    baseline = compute_baseline(model_id, baseline_minutes, window_minutes)
+    run_with_connection(store_baseline_snapshot, model_id, baseline_minutes, window_minutes, baseline)
+    return baseline
+
+
+# Last request time (epoch seconds) per baseline key; refreshed in the background
+# until idle for BASELINE_SNAPSHOT_RETENTION_MINUTES
+_baseline_keys: Dict[Tuple[int, int, int], float] = {}
+# Bumped per (model_id, baseline_minutes, window_minutes) to drop cached baselines early
+_baseline_generations: Dict[Tuple[int, int, int], int] = {}
+# Per-key locks so concurrent cache misses load a baseline once
+_baseline_load_locks: Dict[Tuple[int, int, int], threading.Lock] = {}
+# Guards the three dicts above
+_baseline_keys_lock = threading.Lock()
+
+
+@lru_cache(maxsize=BASELINE_CACHE_SIZE)
+def _load_baseline(model_id: int, baseline_minutes: int, window_minutes: int,
+                   time_bucket: int, generation: int) -> Baseline:
+    """Load the latest baseline snapshot, computing one if it is missing or stale."""
+    baseline = run_with_connection(fetch_baseline_snapshot, model_id, baseline_minutes, window_minutes)
+    if baseline is None:
+        baseline = refresh_baseline(model_id, baseline_minutes, window_minutes)
     
-    if len(rows) < MIN_ADAPTIVE_SAMPLES:
-        # Not enough history, use base thresholds
-        return BASE_KL_THRESHOLD, BASE_COSINE_THRESHOLD, BASE_EMBEDDING_THRESHOLD
+    baseline.distribution.setflags(write=False)
+    if baseline.embedding_direction is not None:
+        baseline.embedding_direction.setflags(write=False)
+    return baseline
+
+
+def get_baseline(model_id: int, baseline_minutes: int, window_minutes: int) -> Baseline:
+    """Return the baseline summary, reusing it for BASELINE_CACHE_BUCKET_SECONDS."""
+    key = (model_id, baseline_minutes, window_minutes)
+    now = time.time()
+    time_bucket = int(now // BASELINE_CACHE_BUCKET_SECONDS)
+    with _baseline_keys_lock:
+        generation = _baseline_generations.get(key, 0)
+        load_lock = _baseline_load_locks.setdefault(key, threading.Lock())
     
-    # Extract metrics
-    kl_values = [r['kl_divergence'] for r in rows if r['kl_divergence'] is not None]
-    cosine_values = [r['cosine_similarity'] for r in rows if r['cosine_similarity'] is not None]
-    embedding_values = [r['embedding_drift'] for r in rows if r['embedding_drift'] is not None]
+    # A miss computes under the key's lock; concurrent callers wait and then hit the cache
+    with load_lock:
+        baseline = _load_baseline(*key, time_bucket, generation)
+    with _baseline_keys_lock:
+        _baseline_keys[key] = now
+    return baseline
+
+
+def invalidate_baseline(model_id: int, baseline_minutes: int, window_minutes: int):
+    """Drop the cached baseline for this key so the next request reloads the latest snapshot."""
+    key = (model_id, baseline_minutes, window_minutes)
+    with _baseline_keys_lock:
+        _baseline_generations[key] = _baseline_generations.get(key, 0) + 1
+
+
+def refresh_all_baselines():
+    """Refresh snapshots for every model's default windows and recently requested keys."""
+    with get_db() as (cursor, _):
+        cursor.execute("SELECT id FROM models")
+        model_ids = {row['id'] for row in cursor.fetchall()}
+        cursor.execute("""
+            DELETE FROM baseline_snapshots 
+            WHERE created_at < NOW() - make_interval(mins => %s)
+        """, (BASELINE_SNAPSHOT_RETENTION_MINUTES,))
+    
+    # Stop refreshing keys that have gone unrequested for the retention window
+    idle_before = time.time() - BASELINE_SNAPSHOT_RETENTION_MINUTES * 60
+    with _baseline_keys_lock:
+        for key in [k for k, requested_at in _baseline_keys.items() if requested_at < idle_before]:
+            del _baseline_keys[key]
+        requested = set(_baseline_keys)
+        for key in [k for k, lock in _baseline_load_locks.items()
+                    if k not in requested and not lock.locked()]:
+            del _baseline_load_locks[key]
+    
+    keys = {(model_id, DEFAULT_BASELINE_MINUTES, DEFAULT_WINDOW_MINUTES) for model_id in model_ids}
+    keys |= {key for key in requested if key[0] in model_ids}
+    for key in keys:
+        try:
+            refresh_baseline(*key)
+        except Exception:
+            logger.exception("Baseline refresh failed for %s", key)
+
+
+async def refresh_baselines_periodically():
+    """Background loop keeping baseline_snapshots fresh."""
+    while True:
+        try:
+            await run_in_threadpool(refresh_all_baselines)
+        except Exception:
+            logger.exception("Baseline refresh failed")
+        await asyncio.sleep(BASELINE_REFRESH_SECONDS)
+
+
+def compute_adaptive_thresholds(cursor, model_id: int) -> Tuple[float, float, float]:
+    """
+    Compute adaptive thresholds from running statistics of stable drift runs.
+    drift_stats is maintained incrementally (Welford) by a trigger on drift_runs.
+    Returns: (kl_threshold, cosine_threshold, embedding_threshold)
+    """
+    cursor.execute("""
+        SELECT metric_name, mean, sqrt(GREATEST(m2, 0) / n) AS std
+        FROM drift_stats 
+        WHERE model_id = %s 
+          AND n >= %s
+    """, (model_id, MIN_ADAPTIVE_SAMPLES))
+    
+    # Metrics without enough history keep their base thresholds
+    stats = {row['metric_name']: row for row in cursor.fetchall()}
     
     # Compute adaptive thresholds: mean + (std * multiplier)
     kl_threshold = BASE_KL_THRESHOLD
-    if kl_values:
-        kl_mean = np.mean(kl_values)
-        kl_std = np.std(kl_values)
-        kl_threshold = kl_mean + (kl_std * ADAPTIVE_STD_MULTIPLIER)
+    if 'kl_divergence' in stats:
+        kl = stats['kl_divergence']
+        kl_threshold = kl['mean'] + (kl['std'] * ADAPTIVE_STD_MULTIPLIER)
         kl_threshold = max(kl_threshold, BASE_KL_THRESHOLD)  # Don't go below base
     
     cosine_threshold = BASE_COSINE_THRESHOLD
-    if cosine_values:
-        cosine_mean = np.mean(cosine_values)
-        cosine_std = np.std(cosine_values)
-        cosine_threshold = cosine_mean - (cosine_std * ADAPTIVE_STD_MULTIPLIER)
+    if 'cosine_similarity' in stats:
+        cos = stats['cosine_similarity']
+        cosine_threshold = cos['mean'] - (cos['std'] * ADAPTIVE_STD_MULTIPLIER)
         cosine_threshold = min(cosine_threshold, BASE_COSINE_THRESHOLD)  # Don't go above base
     
     embedding_threshold = BASE_EMBEDDING_THRESHOLD
-    if embedding_values:
-        emb_mean = np.mean(embedding_values)
-        emb_std = np.std(embedding_values)
-        embedding_threshold = emb_mean + (emb_std * ADAPTIVE_STD_MULTIPLIER)
+    if 'embedding_drift' in stats:
+        emb = stats['embedding_drift']
+        embedding_threshold = emb['mean'] + (emb['std'] * ADAPTIVE_STD_MULTIPLIER)
         embedding_threshold = max(embedding_threshold, BASE_EMBEDDING_THRESHOLD)
     
     return kl_threshold, cosine_threshold, embedding_threshold
 
 
-def store_threshold_history(cursor, model_id: int, metric_name: str, threshold: float, 
-                           sample_count: int, mean_val: float, std_val: float):
-    """Store threshold calculation history for auditing."""
-    cursor.execute("""
+def store_threshold_history(cursor, rows: List[Tuple[int, str, float, int, float, float]]):
+    """
+    Store threshold calculation history for auditing in a single multi-row INSERT.
+    Each row: (model_id, metric_name, threshold, sample_count, mean_val, std_val)
+    """
+    execute_values(cursor, """
         INSERT INTO threshold_history 
         (model_id, metric_name, threshold_value, sample_count, mean_value, std_value)
-        VALUES (%s, %s, %s, %s, %s, %s)
-    """, (model_id, metric_name, threshold, sample_count, mean_val, std_val))
+        VALUES %s
+    """, rows)
+
+
+class PageHinkleyState(NamedTuple):
+    changed: bool
+    sample_count: int
+    threshold: float
+
+
+def fetch_page_hinkley_state(cursor, model_id: int, window_minutes: int) -> Optional[PageHinkleyState]:
+    """
+    Read the Page-Hinkley state maintained by the inference_logs trigger.
+    changed is true when the test fired within the last window_minutes.
+    Expects a tuple cursor (see tuple_cursor).
+    """
+    cursor.execute("""
+        SELECT COALESCE(last_change_at > NOW() - make_interval(mins => %s), false), n, threshold
+        FROM ph_state 
+        WHERE model_id = %s
+    """, (window_minutes, model_id))
+    
+    row = cursor.fetchone()
+    return PageHinkleyState(*row) if row is not None else None
+
+
+def page_hinkley_response(state: Optional[PageHinkleyState]) -> ORJSONResponse:
+    """
+    Build the no-change response of the Page-Hinkley fast path. No histogram metrics
+    are computed, so they are null, which also keeps the run out of drift_stats.
+    """
+    now = datetime.now()
+    return drift_response(
+        kl_divergence=None,
+        cosine_similarity=None,
+        embedding_drift=None,
+        drift_detected=False,
+        window_start=now,
+        window_end=now,
+        sample_count=state.sample_count if state is not None else 0,
+        baseline_count=0,
+        thresholds={"page_hinkley": state.threshold} if state is not None else {},
+    )
+
+
+def compute_adwin_drift(cursor, req: DriftRequest) -> ORJSONResponse:
+    """
+    Detect drift with ADWIN over the confidence stream of the baseline span.
+    The recent set is whatever ADWIN keeps after its last cut, replacing the
+    fixed window_minutes split and the KL threshold.
+    Expects a tuple cursor (see tuple_cursor).
+    """
+    values = fetch_confidence_series(cursor, req.model_id, req.baseline_minutes, 0)
+    now = datetime.now()
+    
+    detector = ADWIN(delta=ADWIN_DELTA)
+    for value in values:
+        detector.update(value)
+    drift_detected = detector.detected_change()
+    
+    recent = values[len(values) - detector.width:]
+    reference = values[:len(values) - detector.width]
+    
+    # Compare the dropped prefix to the kept window for reporting
+    kl, cos = 0.0, 1.0
+    if drift_detected:
+        p = to_distribution(histogram_counts(reference))
+        q = to_distribution(histogram_counts(recent))
+        kl = kl_divergence(p, q)
+        cos = cosine_similarity(p, q)
+    
+    return drift_response(
+        kl_divergence=kl,
+        cosine_similarity=cos,
+        embedding_drift=None,
+        drift_detected=drift_detected,
+        window_start=now,
+        window_end=now,
+        sample_count=len(recent),
+        baseline_count=len(reference),
+        thresholds={"adwin_delta": ADWIN_DELTA},
+    )
+
+
+@app.on_event("startup")
+async def start_baseline_refresh():
+    """Start the background baseline snapshot refresh."""
+    app.state.baseline_refresh = asyncio.create_task(refresh_baselines_periodically())
+
+
+@app.on_event("shutdown")
+def close_pool():
+    """Stop background work and close all pooled database connections."""
+    app.state.baseline_refresh.cancel()
+    _baseline_executor.shutdown(wait=False)
+    if _pool is not None:
+        _pool.closeall()
 
 
 @app.get("/health")
@@ -191,84 +719,115 @@ def health():
     return {"status": "ok"}
 
 
+async def compute_histogram_drift(req: DriftRequest, background_tasks: BackgroundTasks,
+                                  page_hinkley: Optional[PageHinkleyState] = None) -> ORJSONResponse:
+    """
+    Compare the recent confidence histogram and embedding direction to the baseline.
+    With page_hinkley set, drift was already detected and the metrics explain it.
+    """
+    # Fetch recent window, baseline summary (cached) and thresholds concurrently,
+    # each on its own pooled connection
+    (recent_hist, recent_count), (recent_direction, _), baseline, thresholds = await asyncio.gather(
+        run_in_threadpool(run_with_connection, fetch_confidence_histogram,
+                          req.model_id, req.window_minutes, 0),
+        run_in_threadpool(run_with_connection, fetch_embedding_direction,
+                          req.model_id, req.window_minutes, 0),
+        run_in_threadpool(get_baseline, req.model_id, req.baseline_minutes, req.window_minutes),
+        run_in_threadpool(run_with_connection, compute_adaptive_thresholds,
+                          req.model_id, tuple_rows=False),
+    )
+    kl_thresh, cosine_thresh, emb_thresh = thresholds
+    threshold_values = {"kl": kl_thresh, "cosine": cosine_thresh, "embedding": emb_thresh}
+    if page_hinkley is not None:
+        threshold_values["page_hinkley"] = page_hinkley.threshold
+    baseline_count = baseline.sample_count
+    
+    now = datetime.now()
+    
+    # Insufficient data; a Page-Hinkley change still counts as drift
+    if recent_count < MIN_SAMPLES:
+        if page_hinkley is not None:
+            background_tasks.add_task(invalidate_baseline, req.model_id, req.baseline_minutes,
+                                      req.window_minutes)
+        return drift_response(
+            kl_divergence=0.0,
+            cosine_similarity=1.0,
+            embedding_drift=None,
+            drift_detected=page_hinkley is not None,
+            window_start=now,
+            window_end=now,
+            sample_count=recent_count,
+            baseline_count=baseline_count,
+            thresholds=threshold_values if page_hinkley is not None else
+                       {"kl": BASE_KL_THRESHOLD, "cosine": BASE_COSINE_THRESHOLD,
+                        "embedding": BASE_EMBEDDING_THRESHOLD},
+        )
+    
+    # Confidence distributions; use recent data when no baseline is available
+    p = baseline.distribution
+    q = to_distribution(recent_hist)
+    if baseline_count < MIN_SAMPLES:
+        p, baseline_count = q, recent_count
+    
+    # Confidence-based drift
+    kl = kl_divergence(p, q)
+    cos = cosine_similarity(p, q)
+    
+    # Embedding-based drift
+    emb_drift = None
+    if recent_direction is not None and baseline.embedding_direction is not None:
+        emb_drift = embedding_distance(baseline.embedding_direction, recent_direction)
+    
+    # Detect drift using adaptive thresholds
+    drift_detected = (kl > kl_thresh or cos < cosine_thresh)
+    if emb_drift is not None:
+        drift_detected = drift_detected or (emb_drift > emb_thresh)
+    if page_hinkley is not None:
+        drift_detected = True
+    if drift_detected:
+        background_tasks.add_task(invalidate_baseline, req.model_id, req.baseline_minutes,
+                                  req.window_minutes)
+    
+    # Store threshold history for auditing
+    history = [
+        (req.model_id, "kl_divergence", kl_thresh, baseline_count, kl, 0.0),
+        (req.model_id, "cosine_similarity", cosine_thresh, baseline_count, cos, 0.0),
+    ]
+    if emb_drift is not None:
+        history.append((req.model_id, "embedding_drift", emb_thresh,
+                        baseline.embedding_count, emb_drift, 0.0))
+    await run_in_threadpool(run_with_connection, store_threshold_history, history)
+    
+    return drift_response(
+        kl_divergence=kl,
+        cosine_similarity=cos,
+        embedding_drift=emb_drift,
+        drift_detected=drift_detected,
+        window_start=now,
+        window_end=now,
+        sample_count=recent_count,
+        baseline_count=baseline_count,
+        thresholds=threshold_values,
+    )
+
+
 @app.post("/compute_drift", response_model=DriftResponse)
-def compute_drift(req: DriftRequest):
+async def compute_drift(req: DriftRequest, background_tasks: BackgroundTasks):
     """Compute drift metrics comparing recent data to baseline with adaptive thresholds."""
     try:
-        with get_db() as (cursor, conn):
-            # Fetch confidence distributions
-            recent_conf = fetch_confidence_values(cursor, req.model_id, req.window_minutes, 0)
-            baseline_conf = fetch_confidence_values(cursor, req.model_id, req.baseline_minutes, req.window_minutes)
-            
-            # Fetch embeddings
-            recent_emb = fetch_embeddings(cursor, req.model_id, req.window_minutes, 0)
-            baseline_emb = fetch_embeddings(cursor, req.model_id, req.baseline_minutes, req.window_minutes)
-            
-            now = datetime.now()
-            
-            # Insufficient data
-            if len(recent_conf) < MIN_SAMPLES:
-                return DriftResponse(
-                    kl_divergence=0.0,
-                    cosine_similarity=1.0,
-                    embedding_drift=None,
-                    drift_detected=False,
-                    window_start=now,
-                    window_end=now,
-                    sample_count=len(recent_conf),
-                    baseline_count=len(baseline_conf),
-                    thresholds={"kl": BASE_KL_THRESHOLD, "cosine": BASE_COSINE_THRESHOLD, 
-                               "embedding": BASE_EMBEDDING_THRESHOLD},
-                )
-            
-            # No baseline available
-            if len(baseline_conf) < MIN_SAMPLES:
-                baseline_conf = recent_conf
-            
-            # Compute adaptive thresholds
-            kl_thresh, cosine_thresh, emb_thresh = compute_adaptive_thresholds(cursor, req.model_id)
-            
-            # Confidence-based drift
-            p = to_distribution(baseline_conf)
-            q = to_distribution(recent_conf)
-            kl = kl_divergence(p, q)
-            cos = cosine_similarity(p, q)
-            
-            # Embedding-based drift
-            emb_drift = None
-            if recent_emb and baseline_emb:
-                emb_drift = embedding_distance(baseline_emb, recent_emb)
-            
-            # Detect drift using adaptive thresholds
-            drift_detected = (kl > kl_thresh or cos < cosine_thresh)
-            if emb_drift is not None:
-                drift_detected = drift_detected or (emb_drift > emb_thresh)
-            
-            # Store threshold history for auditing
-            store_threshold_history(cursor, req.model_id, "kl_divergence", kl_thresh, 
-                                  len(baseline_conf), np.mean([kl]), 0.0)
-            store_threshold_history(cursor, req.model_id, "cosine_similarity", cosine_thresh,
-                                  len(baseline_conf), np.mean([cos]), 0.0)
-            if emb_drift is not None:
-                store_threshold_history(cursor, req.model_id, "embedding_drift", emb_thresh,
-                                      len(baseline_emb), emb_drift, 0.0)
-            
-            return DriftResponse(
-                kl_divergence=round(kl, 6),
-                cosine_similarity=round(cos, 6),
-                embedding_drift=round(emb_drift, 6) if emb_drift is not None else None,
-                drift_detected=drift_detected,
-                window_start=now,
-                window_end=now,
-                sample_count=len(recent_conf),
-                baseline_count=len(baseline_conf),
-                thresholds={
-                    "kl": round(kl_thresh, 6),
-                    "cosine": round(cosine_thresh, 6),
-                    "embedding": round(emb_thresh, 6)
-                },
-            )
-            
+        if req.detector == "adwin":
+            return await run_in_threadpool(run_with_connection, compute_adwin_drift, req)
+        
+        if req.detector == "page_hinkley":
+            # Fast path: one row of streaming state; histogram metrics only on a change
+            state = await run_in_threadpool(run_with_connection, fetch_page_hinkley_state,
+                                            req.model_id, req.window_minutes)
+            if state is None or not state.changed:
+                return page_hinkley_response(state)
+            return await compute_histogram_drift(req, background_tasks, page_hinkley=state)
+        
+        return await compute_histogram_drift(req, background_tasks)
+        
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -0,0 +1,85 @@
+import struct
+
+import numpy as np
+import pytest
+
+from adwin import ADWIN
+from main import HISTOGRAM_EDGES, PGCOPY_SIGNATURE, histogram_counts, parse_copy_float8
+
+
+def copy_stream(values, null_rows=0) -> bytes:
+    """Build a single float8 column COPY ... (FORMAT BINARY) stream."""
+    header = PGCOPY_SIGNATURE + struct.pack(">ii", 0, 0)
+    rows = b"".join(struct.pack(">hid", 1, 8, v) for v in values)
+    rows += struct.pack(">hi", 1, -1) * null_rows
+    return header + rows + struct.pack(">h", -1)
+
+
+def test_adwin_stationary_stream_keeps_window():
+    values = np.random.default_rng(0).uniform(0.6, 0.8, 2000)
+    detector = ADWIN()
+    for value in values:
+        detector.update(value)
+
+    assert not detector.detected_change()
+    assert detector.width == len(values)
+    assert detector.total == pytest.approx(values.sum())
+
+
+def test_adwin_detects_step_change():
+    rng = np.random.default_rng(1)
+    values = np.concatenate([rng.uniform(0.7, 0.9, 1000), rng.uniform(0.2, 0.4, 1000)])
+    detector = ADWIN()
+    for value in values:
+        detector.update(value)
+
+    assert detector.detected_change()
+    assert detector.width < 1000 + 100
+    assert detector.mean == pytest.approx(0.3, abs=0.05)
+    # Cuts drop whole buckets from the old end, so the window is a suffix of the stream
+    assert detector.total == pytest.approx(values[-detector.width:].sum())
+
+
+def test_adwin_width_and_total_match_buckets():
+    detector = ADWIN()
+    for value in np.random.default_rng(2).random(777):
+        detector.update(value)
+
+    buckets = list(detector._buckets_oldest_first())
+    assert detector.width == sum(size for size, _ in buckets)
+    assert detector.total == pytest.approx(sum(bucket_sum for _, bucket_sum in buckets))
+
+
+@pytest.mark.parametrize("values", [
+    np.arange(0, 1001) / 1000,
+    np.arange(0, 101) / 100,
+    np.array([0.3, 0.6, 0.7, 0.0, 1.0, -0.1, 1.1]),
+    HISTOGRAM_EDGES,
+    np.nextafter(HISTOGRAM_EDGES, 2),
+    np.nextafter(HISTOGRAM_EDGES, -1),
+    np.random.default_rng(3).random(10000),
+])
+def test_histogram_counts_matches_np_histogram(values):
+    expected, _ = np.histogram(values, bins=len(HISTOGRAM_EDGES) - 1, range=(0, 1))
+    np.testing.assert_array_equal(histogram_counts(values), expected)
+
+
+def test_parse_copy_float8():
+    values = parse_copy_float8(copy_stream([0.1, 0.5, 0.999]))
+
+    assert values.dtype == np.float64
+    np.testing.assert_array_equal(values, [0.1, 0.5, 0.999])
+
+
+def test_parse_copy_float8_empty_stream():
+    assert parse_copy_float8(copy_stream([])).size == 0
+
+
+@pytest.mark.parametrize("data", [
+    b"COPY" + copy_stream([0.1])[4:],  # Bad signature
+    copy_stream([0.1])[:-2],  # Missing trailer
+    copy_stream([], null_rows=7),  # NULLs, 7 * 6 bytes look like 3 whole records
+])
+def test_parse_copy_float8_rejects_malformed_streams(data):
+    with pytest.raises(ValueError):
+        parse_copy_float8(data)
@@ -9,6 +9,7 @@ const PYTHON_SERVICE_URL =
 const DRIFT_CONFIG = {
   windowMinutes: 60,
   baselineMinutes: 1440,
+  detector: "page_hinkley",
   criticalThreshold: 0.5,
   cronSchedule: "*/5 * * * *",
 };
@@ -23,6 +24,7 @@ async function computeDrift(modelId) {
     model_id: modelId,
     window_minutes: DRIFT_CONFIG.windowMinutes,
     baseline_minutes: DRIFT_CONFIG.baselineMinutes,
+    detector: DRIFT_CONFIG.detector,
   });
   return response.data;
 }
@@ -68,12 +70,17 @@ async function createAlert(modelId, driftRunId, drift, modelName) {
   console.log(`[ALERT] ${severity}: ${message}`);
 }
 
+function formatMetric(value) {
+  return value === null ? "n/a" : value.toFixed(4);
+}
+
 async function checkModel(model) {
   const drift = await computeDrift(model.id);
   
-  let logMessage = `[${model.name}] KL=${drift.kl_divergence.toFixed(
-    4
-  )} cosine=${drift.cosine_similarity.toFixed(4)}`;
+  // Page-Hinkley no-change responses carry null metrics
+  let logMessage = `[${model.name}] KL=${formatMetric(
+    drift.kl_divergence
+  )} cosine=${formatMetric(drift.cosine_similarity)}`;
   
   if (drift.embedding_drift) {
     logMessage += ` embedding=${drift.embedding_drift.toFixed(4)}`;